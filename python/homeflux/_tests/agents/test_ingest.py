@@ -0,0 +1,150 @@
+"""Tests for homeflux.agents.ingest"""
+import socket
+import asyncio
+import unittest
+from unittest import mock
+
+from homeflux.agents import ingest
+from homeflux.data.data_types import PowerRecord, ClimateRecord
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class TestParse(unittest.TestCase):
+    def test_json(self):
+        body = b'[{"type": "temperature", "location": "office", "value": 72.5},' \
+               b' {"type": "power", "location": "server", "value": 1.2, "unit": "KWH", "time": 1618876800}]'
+        records = ingest.parse(body)
+        self.assertEqual(2, len(records))
+        self.assertIsInstance(records[0], ClimateRecord)
+        self.assertIsInstance(records[1], PowerRecord)
+        self.assertEqual(1200.0, records[1].value)
+        self.assertEqual('home-minute', records[0].bucket)
+
+    def test_line_protocol(self):
+        body = 'temperature,location=office temperature=72.5 1618876800000000000\n' \
+               'power,location=server,source=ups,timescale=hour,rack=a power_usage=120i\n'
+        records = ingest.parse(body)
+        self.assertEqual(2, len(records))
+        self.assertEqual(72.5, records[0].value)
+        self.assertEqual(2021, records[0].time.year)
+        self.assertEqual('ups', records[1].source)
+        self.assertEqual('home-hour', records[1].bucket)
+        self.assertDictEqual({'rack': 'a', 'location': 'server'}, records[1].tags)
+
+    def test_invalid(self):
+        with self.assertRaises(ingest.IngestError):
+            ingest.parse('{"type": "temperature", "value": 72.5}')
+        with self.assertRaises(ingest.IngestError):
+            ingest.parse('{"type": "humidity", "location": "office", "value": 50}')
+        with self.assertRaises(ingest.IngestError):
+            ingest.parse('humidity,location=office humidity=50')
+        with self.assertRaises(ingest.IngestError):
+            ingest.parse('temperature,location=office value=50')
+        with self.assertRaises(ingest.IngestError):
+            ingest.parse(b'temperature,location=\xff temperature=50')
+        with self.assertRaises(ingest.IngestError):
+            ingest.parse('temperature,location=office temperature=50 99999999999999999999999999999')
+
+    def test_power_sensors(self):
+        # Two power sensors must write distinct series
+        for body in ['power,location=server power_usage=120\npower,location=desk power_usage=80',
+                     '[{"type": "power", "location": "server", "value": 120},'
+                     ' {"type": "power", "location": "desk", "value": 80, "tags": {"rack": "a"}}]']:
+            records = ingest.parse(body)
+            series = {tuple(sorted(r.as_influx_dict()['tags'].items())) for r in records}
+            self.assertEqual(2, len(series))
+            self.assertListEqual(['server', 'desk'], [r.as_influx_dict()['tags']['location'] for r in records])
+
+    def test_invalid_time(self):
+        for time in ['1e30', '"1200-01-01T00:00:00"', '"2300-01-01T00:00:00+00:00"']:
+            with self.assertRaises(ingest.IngestError):
+                ingest.parse('{"type": "temperature", "location": "office", "value": 72.5, "time": %s}' % time)
+        with self.assertRaises(ingest.IngestError):
+            ingest.parse('temperature,location=office temperature=50 99999999999999999999')
+
+    def test_invalid_unit(self):
+        with self.assertRaises(ingest.IngestError):
+            ingest.parse('{"type": "power", "location": "server", "value": 120, "unit": "MJ"}')
+        with self.assertRaises(ingest.IngestError):
+            ingest.parse('{"type": "power", "location": "server", "value": 120, "unit": 5}')
+        self.assertEqual(120.0, ingest.parse('{"type": "power", "location": "server", "value": 0.12,'
+                                             ' "unit": "kWh"}')[0].value)
+
+    def test_invalid_timescale(self):
+        with self.assertRaises(ingest.IngestError):
+            ingest.parse('temperature,location=office,timescale=bogus temperature=50')
+        with self.assertRaises(ingest.IngestError):
+            ingest.parse('{"type": "temperature", "location": "office", "value": 72.5, "timescale": "x y"}')
+
+
+class TestIngestServer(unittest.IsolatedAsyncioTestCase):
+    async def test_http(self):
+        port = _free_port()
+        with mock.patch.object(ingest.db, 'write') as write:
+            async with ingest.IngestServer('127.0.0.1', port, 0, batch_size=2, flush_interval=60) as server:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                body = b'temperature,location=office temperature=72.5\ntemperature,location=den temperature=70.1'
+                writer.write(b'POST /write HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+                await writer.drain()
+                self.assertIn(b'204', await reader.readline())
+                while await reader.readline() != b'\r\n':
+                    pass
+
+                writer.write(b'GET /stats HTTP/1.1\r\nConnection: close\r\n\r\n')
+                await writer.drain()
+                response = await reader.read()
+                self.assertIn(b'200', response)
+                self.assertIn(b'homeflux.ingest/office', response)
+                writer.close()
+
+                self.assertEqual(2, server.stats()['homeflux.ingest/office']['total'] +
+                                 server.stats()['homeflux.ingest/den']['total'])
+                await asyncio.sleep(0.1)
+
+        write.assert_called_once()
+        self.assertEqual(2, len(write.call_args[0][0]))
+
+    async def _request(self, port, data):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(data)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def test_http_bad_length(self):
+        port = _free_port()
+        with mock.patch.object(ingest.db, 'write'):
+            async with ingest.IngestServer('127.0.0.1', port, 0, flush_interval=60) as server:
+                response = await self._request(port, b'POST /write HTTP/1.1\r\n\r\n')
+                self.assertIn(b'411', response)
+                response = await self._request(port, b'POST /write HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                                                     b'5\r\nhello\r\n0\r\n\r\n')
+                self.assertIn(b'411', response)
+                self.assertEqual(1, response.count(b'HTTP/1.1'))
+                for length in [b'abc', b'-5']:
+                    response = await self._request(port, b'POST /write HTTP/1.1\r\nContent-Length: %s\r\n\r\n'
+                                                         % length)
+                    self.assertIn(b'400', response)
+                self.assertDictEqual({}, server.stats())
+
+    async def test_http_large_headers(self):
+        port = _free_port()
+        with mock.patch.object(ingest.db, 'write'):
+            async with ingest.IngestServer('127.0.0.1', port, 0, flush_interval=60):
+                response = await self._request(port, b'GET /stats HTTP/1.1\r\nX-Big: %s\r\n\r\n' % (b'a' * 70000))
+                self.assertIn(b'431', response)
+                headers = b''.join(b'X-%d: a\r\n' % i for i in range(ingest._MAX_HEADERS + 1))
+                response = await self._request(port, b'GET /stats HTTP/1.1\r\n%s\r\n' % headers)
+                self.assertIn(b'431', response)
+                response = await self._request(port, b'GET /%s HTTP/1.1\r\n\r\n' % (b'a' * 70000))
+                self.assertIn(b'400', response)
+
+
+if __name__ == '__main__':
+    unittest.main()
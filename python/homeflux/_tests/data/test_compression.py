@@ -0,0 +1,89 @@
+"""Tests for homeflux.data.compression"""
+from datetime import datetime, timedelta
+import unittest
+
+from homeflux.data import compression, data_types
+
+
+def _records(values, location='test_location'):
+    start = datetime(2021, 4, 20, 00, 00, 00)
+    return [data_types.PowerRecord(raw_value=v, unit='WH', source='test_source', location=location,
+                                   time=start + timedelta(minutes=i), timescale='minute') for i, v in enumerate(values)]
+
+
+class TestDeadbandCompressor(unittest.TestCase):
+    def test_compress(self):
+        c = compression.DeadbandCompressor(tolerance=1.0, heartbeat=3600)
+        result = c.compress(_records([100.0, 100.5, 99.5, 100.9, 102.0, 102.5]))
+        self.assertEqual([100.0, 102.0], [r.value for r in result])
+
+    def test_heartbeat(self):
+        c = compression.DeadbandCompressor(tolerance=1.0, heartbeat=120)
+        result = c.compress(_records([100.0] * 5))
+        self.assertEqual(3, len(result))
+
+    def test_series_independent(self):
+        c = compression.DeadbandCompressor(tolerance=1.0, heartbeat=3600)
+        c.compress(_records([100.0], location='a'))
+        result = c.compress(_records([100.0], location='b'))
+        self.assertEqual(1, len(result))
+
+    def test_bad_tolerance(self):
+        with self.assertRaises(ValueError):
+            compression.DeadbandCompressor(tolerance=-1.0)
+
+
+class TestSwingingDoorCompressor(unittest.TestCase):
+    def test_flat(self):
+        c = compression.SwingingDoorCompressor(tolerance=1.0, heartbeat=3600)
+        result = c.compress(_records([100.0, 100.5, 99.5, 100.2, 99.8]))
+        self.assertEqual(1, len(result))
+
+    def test_ramp(self):
+        c = compression.SwingingDoorCompressor(tolerance=0.5, heartbeat=3600)
+        result = c.compress(_records([100.0, 110.0, 120.0, 130.0, 130.0, 130.0, 130.0]))
+        self.assertEqual([100.0, 130.0], [r.value for r in result])
+
+    def test_within_tolerance(self):
+        raw = _records([100.0, 101.0, 103.0, 102.0, 98.0, 97.5, 99.0, 104.0, 104.2, 103.9, 100.0])
+        c = compression.SwingingDoorCompressor(tolerance=1.0, heartbeat=3600)
+        kept = c.compress(raw) + [raw[-1]]
+        for r in raw:
+            before = [k for k in kept if k.time <= r.time][-1]
+            after = [k for k in kept if k.time >= r.time][0]
+            if before.time == after.time:
+                expected = before.value
+            else:
+                ratio = (r.time - before.time) / (after.time - before.time)
+                expected = before.value + ratio * (after.value - before.value)
+            self.assertLessEqual(abs(expected - r.value), 1.0 + 1e-9)
+        self.assertLess(len(kept), len(raw))
+
+    def test_out_of_order(self):
+        c = compression.SwingingDoorCompressor(tolerance=1.0, heartbeat=3600)
+        records = _records([100.0, 105.0, 110.0])
+        duplicate = records[2].copy(update={'raw_value': 120.0})
+        earlier = records[1].copy(update={'raw_value': 90.0})
+        result = c.compress(records + [duplicate, earlier])
+        self.assertEqual([100.0], [r.value for r in result])
+        self.assertIs(records[2], c._state[c.series_key(records[2])]['pending'])
+
+    def test_heartbeat(self):
+        c = compression.SwingingDoorCompressor(tolerance=1.0, heartbeat=120)
+        result = c.compress(_records([100.0] * 5))
+        self.assertEqual(3, len(result))
+
+
+class TestGetCompressor(unittest.TestCase):
+    def test_get_compressor(self):
+        self.assertIsNone(compression.get_compressor(None, 1.0))
+        self.assertIsNone(compression.get_compressor('none', 1.0))
+        self.assertIsInstance(compression.get_compressor('deadband', 1.0), compression.DeadbandCompressor)
+        self.assertIsInstance(compression.get_compressor('swinging_door', 1.0),
+                              compression.SwingingDoorCompressor)
+        with self.assertRaises(ValueError):
+            compression.get_compressor('zip', 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
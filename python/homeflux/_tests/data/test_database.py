@@ -0,0 +1,135 @@
+"""Tests for homeflux.data.database"""
+from datetime import datetime
+import unittest
+from unittest import mock
+
+from influxdb_client.rest import ApiException
+
+from homeflux.data import database, data_types
+
+
+def _records(locations):
+    return [data_types.PowerRecord(raw_value=1.25, unit='WH', source='test_source', location=location,
+                                   time=datetime(2021, 4, 20, 00, 00, 00), timescale='hour',
+                                   tags={'location': location}) for location in locations]
+
+
+class TestHashRing(unittest.TestCase):
+    def test_consistent(self):
+        ring = database.HashRing(['a', 'b', 'c'])
+        self.assertEqual(ring.get('key'), database.HashRing(['c', 'b', 'a']).get('key'))
+
+    def test_distribution(self):
+        ring = database.HashRing(['a', 'b', 'c'])
+        owners = {ring.get(f'key-{i}') for i in range(100)}
+        self.assertSetEqual({'a', 'b', 'c'}, owners)
+
+    def test_remove_node(self):
+        keys = [f'key-{i}' for i in range(100)]
+        before = database.HashRing(['a', 'b', 'c'])
+        after = database.HashRing(['a', 'b'])
+        for key in keys:
+            if before.get(key) != 'c':
+                self.assertEqual(before.get(key), after.get(key))
+
+    def test_no_nodes(self):
+        with self.assertRaises(ValueError):
+            database.HashRing([])
+
+
+class TestEndpoint(unittest.TestCase):
+    def test_queue_limit(self):
+        e = database.Endpoint('http://a:8086', max_queue=3)
+        e.enqueue('home-hour', [{'n': 1}, {'n': 2}])
+        e.enqueue('home-hour', [{'n': 3}, {'n': 4}])
+        self.assertEqual(3, e.queued)
+
+    def test_failed_flush(self):
+        e = database.Endpoint('http://a:8086')
+        e._client = mock.MagicMock()
+        api = e._client.write_api.return_value.__enter__.return_value
+        api.write.side_effect = RuntimeError('down')
+        e.enqueue('home-hour', [{'n': 1}])
+        self.assertEqual(0, e.flush())
+        self.assertEqual(1, e.queued)
+        self.assertEqual(1, e.failures)
+        self.assertFalse(e.healthy)
+
+        # Backing off, the server is not contacted again
+        self.assertEqual(0, e.flush())
+        self.assertEqual(1, api.write.call_count)
+
+        e.retry_time = 0.0
+        api.write.side_effect = None
+        self.assertEqual(1, e.flush())
+        self.assertEqual(0, e.queued)
+        self.assertEqual(0, e.failures)
+
+    def test_rejected_bucket(self):
+        e = database.Endpoint('http://a:8086')
+        e._client = mock.MagicMock()
+        api = e._client.write_api.return_value.__enter__.return_value
+
+        def write(bucket, org, points):
+            if bucket == 'home-bogus':
+                raise ApiException(status=404, reason='bucket not found')
+            if bucket == 'home-hour':
+                raise RuntimeError('timeout')
+
+        api.write.side_effect = write
+        e.enqueue('home-bogus', [{'n': 1}])
+        e.enqueue('home-hour', [{'n': 2}])
+        e.enqueue('home-minute', [{'n': 3}, {'n': 4}])
+        self.assertEqual(2, e.flush())
+        # The rejected bucket is dropped, the failed bucket is kept for the retry
+        self.assertDictEqual({'home-hour': [{'n': 2}]}, e._queue)
+        self.assertEqual(1, e.failures)
+
+    def test_rejected_point(self):
+        e = database.Endpoint('http://a:8086')
+        e._client = mock.MagicMock()
+        api = e._client.write_api.return_value.__enter__.return_value
+
+        def write(bucket, org, points):
+            if {'n': 3} in points:
+                raise ApiException(status=422, reason='field type conflict')
+
+        api.write.side_effect = write
+        e.enqueue('home-minute', [{'n': n} for n in range(5)])
+        self.assertEqual(4, e.flush())
+        self.assertEqual(0, e.queued)
+        self.assertEqual(0, e.failures)
+
+    def test_concurrent_flush(self):
+        e = database.Endpoint('http://a:8086')
+        e._client = mock.MagicMock()
+        e.enqueue('home-hour', [{'n': 1}])
+        with e._flush_lock:
+            self.assertEqual(0, e.flush())
+        self.assertEqual(1, e.queued)
+        self.assertEqual(1, e.flush())
+
+
+class TestWriter(unittest.TestCase):
+    def test_replicate(self):
+        w = database.Writer(['http://a:8086', 'http://b:8086'], database.REPLICATE)
+        w.enqueue(_records(['x', 'y', 'z']))
+        for endpoint in w.endpoints.values():
+            self.assertEqual(3, endpoint.queued)
+
+    def test_partition(self):
+        w = database.Writer(['http://a:8086', 'http://b:8086'], database.PARTITION)
+        locations = [f'location-{i}' for i in range(20)]
+        w.enqueue(_records(locations))
+        self.assertEqual(20, sum(e.queued for e in w.endpoints.values()))
+        self.assertTrue(all(e.queued for e in w.endpoints.values()))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            database.Writer([])
+        with self.assertRaises(ValueError):
+            database.Writer(['http://a:8086'], 'broadcast')
+
+
+if __name__ == '__main__':
+    unittest.main()
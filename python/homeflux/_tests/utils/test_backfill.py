@@ -0,0 +1,117 @@
+"""Tests for homeflux.utils.backfill"""
+from datetime import date, datetime, timedelta, timezone
+import unittest
+from unittest import mock
+
+from homeflux import environment
+from homeflux.utils import backfill, time_utils
+
+
+def _series(name):
+    return [s for s in backfill.GWP_SERIES if s['name'] == name][0]
+
+
+class TestBackfill(unittest.TestCase):
+    def test_coalesce(self):
+        bitmap = [True, False, False, True, False, True]
+        ranges = backfill.coalesce(bitmap, date(2021, 4, 20))
+        self.assertListEqual([(date(2021, 4, 21), date(2021, 4, 24))], ranges)
+
+    def test_coalesce_complete(self):
+        self.assertListEqual([], backfill.coalesce([True] * 10, date(2021, 4, 20)))
+
+    def test_coalesce_max_days(self):
+        start = date(2021, 1, 1)
+        ranges = backfill.coalesce([False] * 65, start)
+        self.assertEqual(3, len(ranges))
+        for s, e in ranges:
+            self.assertLess((e - s).days, backfill.MAX_REQUEST_DAYS)
+        self.assertEqual(start, ranges[0][0])
+        self.assertEqual(start + timedelta(days=64), ranges[-1][1])
+
+    def test_coalesce_far_gaps(self):
+        bitmap = [True] * 100
+        bitmap[0] = bitmap[99] = False
+        ranges = backfill.coalesce(bitmap, date(2021, 1, 1))
+        self.assertListEqual([(date(2021, 1, 1), date(2021, 1, 1)), (date(2021, 4, 10), date(2021, 4, 10))], ranges)
+
+    def test_request_deltas(self):
+        today = date(2021, 4, 30)
+        self.assertEqual((-10, -10), backfill.request_deltas(_series('power_daily'), date(2021, 4, 20),
+                                                             date(2021, 4, 20), today))
+        # The hourly weather window ends at midnight, so it runs to the day after
+        self.assertEqual((-10, -9), backfill.request_deltas(_series('weather_hourly'), date(2021, 4, 20),
+                                                            date(2021, 4, 20), today))
+        self.assertEqual((-29, 0), backfill.request_deltas(_series('weather_hourly'), date(2021, 4, 1),
+                                                           date(2021, 4, 29), today))
+
+
+class TestLocalDays(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(environment, 'TIMEZONE', 'America/Los_Angeles')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        time_utils.timezone.cache_clear()
+        self.addCleanup(time_utils.timezone.cache_clear)
+
+    def test_local_day(self):
+        # Local 17:00-23:00 on the 20th falls on the 21st in UTC
+        times = [datetime(2021, 4, 20, 7, tzinfo=timezone.utc) + timedelta(hours=h) for h in range(24)]
+        self.assertDictEqual({date(2021, 4, 20): 24}, backfill.count_local_days(times))
+
+    def test_end_stamped(self):
+        # Hours ending 01:00 through midnight the next day
+        times = [datetime(2021, 4, 20, 8, tzinfo=timezone.utc) + timedelta(hours=h) for h in range(24)]
+        self.assertDictEqual({date(2021, 4, 20): 24}, backfill.count_local_days(times, end_stamped=True))
+
+    def test_expected_points(self):
+        self.assertEqual(24, backfill.expected_points(date(2021, 4, 20), hourly=True))
+        self.assertEqual(23, backfill.expected_points(date(2021, 3, 14), hourly=True))
+        self.assertEqual(25, backfill.expected_points(date(2021, 11, 7), hourly=True))
+        self.assertEqual(1, backfill.expected_points(date(2021, 3, 14), hourly=False))
+
+    def test_coverage(self):
+        # 23 points only make a complete day when DST starts
+        counts = {date(2021, 3, 13): 23, date(2021, 3, 14): 23, date(2021, 3, 15): 24, date(2021, 3, 16): 12}
+        bitmap = backfill.coverage(counts, date(2021, 3, 13), date(2021, 3, 17), hourly=True)
+        self.assertListEqual([False, True, True, False, False], bitmap)
+
+
+class TestQueryDailyCounts(unittest.TestCase):
+    def setUp(self):
+        for name, value in [('INFLUX_URLS', ['http://a:8086', 'http://b:8086']), ('TIMEZONE', 'UTC')]:
+            patcher = mock.patch.object(environment, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        time_utils.timezone.cache_clear()
+        self.addCleanup(time_utils.timezone.cache_clear)
+
+    def _client(self, url, **kwargs):
+        client = mock.MagicMock()
+        if url == 'http://b:8086':
+            client.query_api.return_value.query.side_effect = ConnectionError('unreachable')
+        else:
+            record = mock.MagicMock()
+            record.get_time.return_value = datetime(2021, 4, 20, 12, tzinfo=timezone.utc)
+            client.query_api.return_value.query.return_value = [mock.MagicMock(records=[record])]
+        self.clients.append(client)
+        return client
+
+    def test_unreachable_endpoint(self):
+        self.clients = []
+        with mock.patch.object(backfill, 'InfluxDBClient', side_effect=self._client):
+            counts = backfill.query_daily_counts(_series('power_daily'), date(2021, 4, 20), date(2021, 4, 20))
+        self.assertDictEqual({date(2021, 4, 20): 1}, counts)
+        for client in self.clients:
+            client.close.assert_called_once()
+
+    def test_no_endpoints(self):
+        self.clients = []
+        with mock.patch.object(environment, 'INFLUX_URLS', ['http://b:8086']):
+            with mock.patch.object(backfill, 'InfluxDBClient', side_effect=self._client):
+                with self.assertRaises(RuntimeError):
+                    backfill.query_daily_counts(_series('power_daily'), date(2021, 4, 20), date(2021, 4, 20))
+
+
+if __name__ == '__main__':
+    unittest.main()
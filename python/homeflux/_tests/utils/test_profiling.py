@@ -0,0 +1,62 @@
+"""Tests for homeflux.utils.profiling"""
+import os
+import asyncio
+import tempfile
+import tracemalloc
+import unittest
+from unittest import mock
+
+from homeflux import environment
+from homeflux.utils import profiling
+
+
+async def agent_tick():
+    return 42
+
+
+async def slow_tick():
+    await asyncio.sleep(0.05)
+    return 1
+
+
+class TestProfiling(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(environment, 'PROFILE_DIR', self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+    async def test_profile_tick_disabled(self):
+        wrapped = profiling.profile_tick(agent_tick)
+        self.assertEqual(42, await wrapped())
+        self.assertListEqual([], os.listdir(self.tmp.name))
+
+    async def test_profile_tick(self):
+        wrapped = profiling.profile_tick(agent_tick)
+        with mock.patch.object(environment, 'PROFILE_AGENTS', ['agent_tick']):
+            self.assertEqual(42, await wrapped())
+        files = os.listdir(self.tmp.name)
+        self.assertEqual(1, len(files))
+        self.assertTrue(files[0].startswith('agent_tick-'))
+        self.assertTrue(files[0].endswith('.prof'))
+
+    async def test_profile_tick_overlap(self):
+        wrapped = profiling.profile_tick(slow_tick)
+        with mock.patch.object(environment, 'PROFILE_AGENTS', ['slow_tick']):
+            self.assertListEqual([1, 1], await asyncio.gather(wrapped(), wrapped()))
+        self.assertEqual(1, len(os.listdir(self.tmp.name)))
+        self.assertFalse(profiling._profile_active)
+
+    def test_snapshot_memory(self):
+        self.assertIsNone(profiling.snapshot_memory())
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        path = profiling.snapshot_memory()
+        self.assertTrue(os.path.isfile(path))
+        with open(path) as f:
+            self.assertIn('Top 25 allocations', f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
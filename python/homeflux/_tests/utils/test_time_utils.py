@@ -0,0 +1,50 @@
+"""Tests for homeflux.utils.time_utils"""
+from datetime import date, datetime, timezone
+import unittest
+from unittest import mock
+
+from homeflux import environment
+from homeflux.data import data_types
+from homeflux.utils import time_utils
+
+
+class TestTimeUtils(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(environment, 'TIMEZONE', 'America/Los_Angeles')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for cached in [time_utils.timezone, time_utils._local_offset]:
+            cached.cache_clear()
+            self.addCleanup(cached.cache_clear)
+
+    def test_offset_dst(self):
+        self.assertEqual('-08:00', time_utils.format_offset(date(2021, 3, 13)))
+        self.assertEqual('-07:00', time_utils.format_offset(date(2021, 3, 15)))
+        self.assertEqual('-07:00', time_utils.format_offset(date(2021, 3, 14), hour=3))
+        self.assertEqual('T00%3A00%3A00-07%3A00', time_utils.url_time(date(2021, 4, 20)))
+
+    def test_to_epoch(self):
+        timestamps = ['2021-04-20T01:00:00.000-07:00', '2021-04-20T08:00:00.000Z', '2021-04-20T01:00:00',
+                      '2021-01-20T01:00:00']
+        expected = [datetime(2021, 4, 20, 8, tzinfo=timezone.utc).timestamp()] * 3 + \
+                   [datetime(2021, 1, 20, 9, tzinfo=timezone.utc).timestamp()]
+        self.assertListEqual(expected, time_utils.to_epoch(timestamps))
+
+    def test_to_epoch_local_date(self):
+        epochs = time_utils.to_epoch(['2021-03-13T00:00:00.000Z', '2021-03-15T00:00:00.000Z'], local_date=True)
+        self.assertEqual(datetime(2021, 3, 13, 8, tzinfo=timezone.utc).timestamp(), epochs[0])
+        self.assertEqual(datetime(2021, 3, 15, 7, tzinfo=timezone.utc).timestamp(), epochs[1])
+
+    def test_record_time(self):
+        epoch = time_utils.to_epoch(['2021-04-20T01:00:00.000-07:00'])[0]
+        r = data_types.ClimateRecord(timescale='hour', time=epoch, raw_value=79.9, location='test_location',
+                                     source='test_source')
+        self.assertEqual(datetime(2021, 4, 20, 8, tzinfo=timezone.utc), r.time)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            time_utils.to_epoch(['yesterday'])
+
+
+if __name__ == '__main__':
+    unittest.main()
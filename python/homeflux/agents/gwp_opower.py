@@ -8,6 +8,7 @@ import requests_mock
 
 from homeflux import urls, environment, log
 from homeflux.data.data_types import PowerRecord, ClimateRecord
+from homeflux.utils import time_utils
 
 
 class MeterError(Exception):
@@ -87,9 +88,10 @@ class Meter:
 
         try:
             # Get get start time and end time
-            start_date = str(datetime.date.today() + datetime.timedelta(days=start_date_delta))
-            end_date = str(datetime.date.today() + datetime.timedelta(days=end_date_delta))
-            fmt = {'start_date': start_date, 'end_date': end_date, 'account_uuid': self.account_uuid, 'time': urls.TIME}
+            start_date = datetime.date.today() + datetime.timedelta(days=start_date_delta)
+            end_date = datetime.date.today() + datetime.timedelta(days=end_date_delta)
+            fmt = {'start_date': start_date, 'end_date': end_date, 'account_uuid': self.account_uuid,
+                   'start_time': time_utils.url_time(start_date), 'end_time': time_utils.url_time(end_date)}
             url = raw_url.format(**fmt)
 
             log.debug('Connecting to %s', url)
@@ -131,8 +133,9 @@ class Meter:
         if not data:
             return result
         unit = data['units']['consumption']
-        for read in data['reads']:
-            obj = PowerRecord(time=read['endTime'], raw_value=read['consumption']['value'], unit=unit, timescale='hour',
+        times = time_utils.to_epoch([read['endTime'] for read in data['reads']])
+        for read, t in zip(data['reads'], times):
+            obj = PowerRecord(time=t, raw_value=read['consumption']['value'], unit=unit, timescale='hour',
                               source='homeflux.gwp_opower', location='gwp_meter')
             log.debug(repr(obj))
             result.append(obj)
@@ -155,8 +158,9 @@ class Meter:
         result = []
         if not data:
             return []
-        for read in data['reads']:
-            obj = ClimateRecord(time=read['date'], raw_value=read['meanTemperature'], timescale='hour',
+        times = time_utils.to_epoch([read['date'] for read in data['reads']])
+        for read, t in zip(data['reads'], times):
+            obj = ClimateRecord(time=t, raw_value=read['meanTemperature'], timescale='hour',
                                 location='gwp_meter', source='homeflux.gwp_opower')
             log.debug(repr(obj))
             result.append(obj)
@@ -180,8 +184,9 @@ class Meter:
         if not data:
             return result
         unit = data['units']['consumption']
-        for read in data['reads']:
-            obj = PowerRecord(time=read['endTime'], raw_value=read['consumption']['value'], unit=unit, timescale='day',
+        times = time_utils.to_epoch([read['endTime'] for read in data['reads']])
+        for read, t in zip(data['reads'], times):
+            obj = PowerRecord(time=t, raw_value=read['consumption']['value'], unit=unit, timescale='day',
                               source='homeflux.gwp_opower', location='gwp_meter')
             log.debug(repr(obj))
             result.append(obj)
@@ -204,9 +209,11 @@ class Meter:
         result = []
         if not data:
             return []
-        for read in data['reads']:
-            obj = ClimateRecord(time=read['date'].replace('.000Z', urls.UTC_OFFSET), raw_value=read['meanTemperature'],
-                                timescale='day', location='gwp_meter', source='homeflux.gwp_opower')
+        # Daily weather reads mark the local date as midnight UTC
+        times = time_utils.to_epoch([read['date'] for read in data['reads']], local_date=True)
+        for read, t in zip(data['reads'], times):
+            obj = ClimateRecord(time=t, raw_value=read['meanTemperature'], timescale='day', location='gwp_meter',
+                                source='homeflux.gwp_opower')
             log.debug(repr(obj))
             result.append(obj)
 
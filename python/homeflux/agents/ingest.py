@@ -0,0 +1,432 @@
+"""Module for receiving readings pushed by local sensors over HTTP or UDP"""
+import json
+import time
+import asyncio
+import datetime
+from typing import Dict, List, Optional, Union
+
+import pydantic
+
+from homeflux import environment, log
+from homeflux.data import database as db
+from homeflux.data.data_types import AbstractRecord, PowerRecord, ClimateRecord
+
+
+class IngestError(ValueError):
+    pass
+
+
+_STATUS = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           411: 'Length Required', 413: 'Payload Too Large', 431: 'Request Header Fields Too Large'}
+
+_MAX_HEADERS = 100
+
+_TIMESCALES = ['minute', 'hour', 'day', 'week']
+
+_UNITS = ['WH', 'KWH']
+
+# Range of times InfluxDB can store, as nanoseconds from the epoch in a signed 64 bit integer
+_MIN_TIME = datetime.datetime(1677, 9, 21, 0, 12, 43, 145225)
+_MAX_TIME = datetime.datetime(2262, 4, 11, 23, 47, 16, 854775)
+
+# Line protocol measurement and field for each record type
+_LINE_PROTOCOL = {'temperature': ('temperature', ClimateRecord),
+                  'power': ('power_usage', PowerRecord)}
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.utcnow().replace(microsecond=0)
+
+
+def _timescale(value) -> str:
+    # The timescale becomes part of the bucket name, so only allow the buckets that exist
+    if value not in _TIMESCALES:
+        raise IngestError(f'Invalid timescale "{value}"')
+    return value
+
+
+def _unit(value) -> str:
+    if not isinstance(value, str) or value.upper() not in _UNITS:
+        raise IngestError(f'Invalid unit "{value}"')
+    return value
+
+
+def _check_times(records: List[AbstractRecord]) -> List[AbstractRecord]:
+    # Times outside of what InfluxDB can store would fail the whole batch when written
+    for r in records:
+        try:
+            t = r.time.astimezone(datetime.timezone.utc).replace(tzinfo=None) if r.time.tzinfo else r.time
+        except OverflowError:
+            t = r.time.replace(tzinfo=None)
+        if not _MIN_TIME <= t <= _MAX_TIME:
+            raise IngestError(f'Time {r.time.isoformat()} is out of range')
+    return records
+
+
+def parse_json(body: Union[str, bytes]) -> List[AbstractRecord]:
+    """Return the records from a JSON object, or list of objects, in the form of:
+    `{"type": "temperature", "location": "office", "value": 72.5}` or
+    `{"type": "power", "location": "server", "value": 120, "unit": "WH"}` with optional "source", "time" (ISO string or
+    epoch seconds), "timescale" (default minute) and for power "tags". The location is kept as a tag on power records.
+
+    Args:
+        body (Union[str, bytes]): Request body.
+
+    Returns:
+        List[AbstractRecord]: List of validated records.
+    """
+    try:
+        items = json.loads(body)
+    except ValueError as e:
+        raise IngestError(f'Invalid JSON: {e}')
+    if isinstance(items, dict):
+        items = [items]
+    if not isinstance(items, list):
+        raise IngestError('Expected a JSON object or list of objects')
+
+    now = _now()
+    climate, power = [], []
+    for item in items:
+        if not isinstance(item, dict) or 'value' not in item:
+            raise IngestError(f'Invalid reading {item!r}')
+        data = {'raw_value': item['value'], 'location': item.get('location'), 'time': item.get('time', now),
+                'source': item.get('source', 'homeflux.ingest'),
+                'timescale': _timescale(item.get('timescale', 'minute'))}
+        record_type = item.get('type')
+        if record_type == 'temperature':
+            climate.append(data)
+        elif record_type == 'power':
+            tags = item.get('tags') or {}
+            if not isinstance(tags, dict):
+                raise IngestError(f'Invalid tags {tags!r}')
+            data.update({'unit': _unit(item.get('unit', 'WH')), 'tags': {**tags, 'location': item.get('location')}})
+            power.append(data)
+        else:
+            raise IngestError(f'Invalid reading type "{record_type}"')
+
+    try:
+        records = pydantic.parse_obj_as(List[ClimateRecord], climate) + pydantic.parse_obj_as(List[PowerRecord], power)
+    except pydantic.ValidationError as e:
+        raise IngestError(str(e))
+    return _check_times(records)
+
+
+def parse_line_protocol(body: Union[str, bytes]) -> List[AbstractRecord]:
+    """Return the records from InfluxDB line protocol, one reading per line in the form of:
+    `temperature,location=office temperature=72.5 1618876800000000000` or `power,location=server power_usage=120`.
+    The "location" tag is required, "source" and "timescale" tags are optional and any other tags, along with the
+    location, are kept on power records. The timestamp is in nanoseconds and defaults to now. Escaped characters are not supported.
+
+    Args:
+        body (Union[str, bytes]): Request body.
+
+    Returns:
+        List[AbstractRecord]: List of validated records.
+    """
+    if isinstance(body, bytes):
+        try:
+            body = body.decode()
+        except UnicodeDecodeError:
+            raise IngestError('Body is not valid UTF-8')
+
+    now = _now()
+    data = {ClimateRecord: [], PowerRecord: []}
+    for line in body.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split(' ')
+        if len(parts) not in [2, 3]:
+            raise IngestError(f'Invalid line "{line}"')
+        measurement, *tag_list = parts[0].split(',')
+        if measurement not in _LINE_PROTOCOL:
+            raise IngestError(f'Invalid measurement "{measurement}"')
+        field, record_type = _LINE_PROTOCOL[measurement]
+        try:
+            tags = dict(t.split('=', 1) for t in tag_list)
+            fields = dict(f.split('=', 1) for f in parts[1].split(','))
+            dt = now if len(parts) == 2 else datetime.datetime.utcfromtimestamp(int(parts[2]) / 1e9)
+        except (ValueError, OverflowError, OSError):
+            raise IngestError(f'Invalid line "{line}"')
+        if field not in fields:
+            raise IngestError(f'Missing field "{field}" in line "{line}"')
+
+        item = {'raw_value': fields[field].rstrip('i'), 'time': dt, 'location': tags.get('location'),
+                'source': tags.pop('source', 'homeflux.ingest'),
+                'timescale': _timescale(tags.pop('timescale', 'minute'))}
+        if record_type is PowerRecord:
+            item.update({'unit': 'WH', 'tags': tags})
+        data[record_type].append(item)
+
+    try:
+        records = pydantic.parse_obj_as(List[ClimateRecord], data[ClimateRecord]) + \
+            pydantic.parse_obj_as(List[PowerRecord], data[PowerRecord])
+    except pydantic.ValidationError as e:
+        raise IngestError(str(e))
+    return _check_times(records)
+
+
+def parse(body: Union[str, bytes], content_type: str = '') -> List[AbstractRecord]:
+    """Return the records from a request body, as JSON if the content type or body says so and line protocol if not.
+
+    Args:
+        body (Union[str, bytes]): Request body.
+        content_type (Optional[str]): Content-Type header of the request.
+
+    Returns:
+        List[AbstractRecord]: List of validated records.
+    """
+    if 'json' in content_type or body.lstrip()[:1] in [b'{', b'[', '{', '[']:
+        return parse_json(body)
+    return parse_line_protocol(body)
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server: 'IngestServer'):
+        self.server = server
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            self.server.add(parse(data))
+        except IngestError as e:
+            log.debug('Invalid datagram from %s: %s', addr[0], e)
+
+
+class IngestServer:
+    """Asyncio server receiving readings pushed by local sensors.
+
+    Readings are POSTed to `/write` over HTTP, or sent as UDP datagrams, as JSON or line protocol (see `parse`).
+    They are buffered and written to the database in batches every `flush_interval` seconds or once `batch_size`
+    records are waiting, so a request never waits on the database. Per sensor rates are served on `/stats`.
+    """
+    host: str
+    port: int
+    udp_port: int
+    batch_size: int
+    flush_interval: float
+    max_body: int
+    _buffer: List[AbstractRecord]
+    _counts: Dict[str, int]
+    _totals: Dict[str, int]
+    _rates: Dict[str, float]
+    _window_start: float
+    _flush_event: Optional[asyncio.Event] = None
+    _flush_task: Optional[asyncio.Task] = None
+    _server: Optional[asyncio.AbstractServer] = None
+    _transport: Optional[asyncio.DatagramTransport] = None
+
+    def __init__(self, host: str = None, port: int = None, udp_port: int = None, batch_size: int = None,
+                 flush_interval: float = None):
+        """Initialize server object (without listening).
+
+        Args:
+            host (Optional[str]): Address to listen on, default from environment.
+            port (Optional[int]): HTTP port, 0 to disable, default from environment.
+            udp_port (Optional[int]): UDP port, 0 to disable, default from environment.
+            batch_size (Optional[int]): Number of buffered records which triggers a write, default from environment.
+            flush_interval (Optional[float]): Maximum seconds between writes, default from environment.
+        """
+        self.host = host if host is not None else environment.INGEST_HOST
+        self.port = port if port is not None else environment.INGEST_PORT
+        self.udp_port = udp_port if udp_port is not None else environment.INGEST_UDP_PORT
+        self.batch_size = batch_size if batch_size is not None else environment.INGEST_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else environment.INGEST_FLUSH_INTERVAL
+        self.max_body = environment.INGEST_MAX_BODY
+        self._buffer = []
+        self._counts = {}
+        self._totals = {}
+        self._rates = {}
+        self._window_start = time.monotonic()
+
+    def __repr__(self):
+        return f'[{self.__class__.__name__} {self.host} http={self.port} udp={self.udp_port}]'
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def start(self):
+        """Start listening and start the background flush task.
+
+        """
+        loop = asyncio.get_running_loop()
+        self._flush_event = asyncio.Event()
+        self._flush_task = loop.create_task(self._flush_loop())
+        if self.port:
+            self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+            log.info('Listening for HTTP readings on %s:%s', self.host, self.port)
+        if self.udp_port:
+            self._transport, _ = await loop.create_datagram_endpoint(lambda: _UdpProtocol(self),
+                                                                     local_addr=(self.host, self.udp_port))
+            log.info('Listening for UDP readings on %s:%s', self.host, self.udp_port)
+
+    async def stop(self):
+        """Stop listening and write any buffered records.
+
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    def add(self, records: List[AbstractRecord]) -> None:
+        """Buffer records to be written and count them towards their sensor's rate.
+
+        Args:
+            records (List[AbstractRecord]): List of records to buffer.
+
+        Returns:
+            None
+        """
+        self._buffer.extend(records)
+        for r in records:
+            sensor = f'{r.source}/{r.location}'
+            self._counts[sensor] = self._counts.get(sensor, 0) + 1
+        if len(self._buffer) >= self.batch_size and self._flush_event is not None:
+            self._flush_event.set()
+
+    async def flush(self) -> None:
+        """Write all buffered records to the database without blocking the event loop.
+
+        """
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        log.debug('Writing %s ingested records', len(batch))
+        if not environment.DRY_RUN:
+            try:
+                await db.write_async(batch)
+            except Exception:
+                log.exception('Failed to write %s ingested records', len(batch))
+
+    def stats(self) -> Dict[str, dict]:
+        """Return the total number of readings and the rate per second, over the last flush interval, per sensor.
+
+        Returns:
+            Dict[str, dict]: Stats keyed by sensor in the form of "{source}/{location}".
+        """
+        sensors = set(self._totals) | set(self._counts)
+        return {s: {'total': self._totals.get(s, 0) + self._counts.get(s, 0), 'rate': round(self._rates.get(s, 0.0), 3)}
+                for s in sorted(sensors)}
+
+    def _update_rates(self):
+        now = time.monotonic()
+        elapsed = max(now - self._window_start, 1e-6)
+        self._rates = {s: c / elapsed for s, c in self._counts.items()}
+        for s, c in self._counts.items():
+            self._totals[s] = self._totals.get(s, 0) + c
+        self._counts = {}
+        self._window_start = now
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            if time.monotonic() - self._window_start >= self.flush_interval:
+                self._update_rates()
+                log.debug('Ingest rates: %s', self._rates)
+            await self.flush()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                except ValueError:
+                    await self._respond(writer, 400, 'Request line too long', keep_alive=False)
+                    break
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, 'Invalid request line', keep_alive=False)
+                    break
+
+                headers, too_large = {}, False
+                while True:
+                    try:
+                        line = await reader.readline()
+                    except ValueError:
+                        too_large = True
+                        break
+                    if line in [b'\r\n', b'\n', b'']:
+                        break
+                    if len(headers) >= _MAX_HEADERS:
+                        too_large = True
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                if too_large:
+                    await self._respond(writer, 431, 'Request headers too large', keep_alive=False)
+                    break
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+                if 'transfer-encoding' in headers:
+                    await self._respond(writer, 411, 'Transfer-Encoding is not supported, use Content-Length',
+                                        keep_alive=False)
+                    break
+                if 'content-length' not in headers:
+                    if method == 'POST':
+                        await self._respond(writer, 411, 'Content-Length is required', keep_alive=False)
+                        break
+                    length = 0
+                else:
+                    try:
+                        length = int(headers['content-length'])
+                    except ValueError:
+                        length = -1
+                    if length < 0:
+                        await self._respond(writer, 400, 'Invalid Content-Length', keep_alive=False)
+                        break
+                if length > self.max_body:
+                    await self._respond(writer, 413, 'Body too large', keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                if path.split('?')[0] == '/write':
+                    if method != 'POST':
+                        await self._respond(writer, 405, 'Use POST', keep_alive)
+                    else:
+                        try:
+                            self.add(parse(body, headers.get('content-type', '')))
+                        except IngestError as e:
+                            await self._respond(writer, 400, str(e), keep_alive)
+                        else:
+                            await self._respond(writer, 204, '', keep_alive)
+                elif path.split('?')[0] == '/stats':
+                    await self._respond(writer, 200, json.dumps(self.stats()), keep_alive, 'application/json')
+                else:
+                    await self._respond(writer, 404, 'Not found', keep_alive)
+
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, body: str, keep_alive: bool,
+                       content_type: str = 'text/plain'):
+        data = body.encode()
+        head = [f'HTTP/1.1 {status} {_STATUS[status]}', f'Content-Length: {len(data)}',
+                f'Connection: {"keep-alive" if keep_alive else "close"}']
+        if data:
+            head.append(f'Content-Type: {content_type}')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+        await writer.drain()
@@ -1,15 +1,22 @@
 """Main Point of Entry"""
+import signal
 import asyncio
 
 import aiocron
 
 from homeflux import environment, log
 from homeflux.utils.timer import Timer
+from homeflux.utils import profiling
 from homeflux.data import database as db
-from homeflux.agents import gwp_opower, nut
+from homeflux.data import compression
+from homeflux.agents import gwp_opower, nut, ingest
+
+nut_compressor = compression.get_compressor(environment.NUT_COMPRESSION, environment.NUT_COMPRESSION_TOLERANCE,
+                                            environment.NUT_COMPRESSION_HEARTBEAT)
 
 
 # @aiocron.crontab('*/1 * * * *')  # Run every minute
+@profiling.profile_tick
 async def nut_main():
     """Main NUT gather loop, designed to run forever on an interval.
 
@@ -41,11 +48,16 @@ async def nut_main():
 
     log.info('Took %s seconds to read %s records from NUT', t.end(), len(reads))
 
+    if nut_compressor is not None:
+        reads = nut_compressor.compress(reads)
+        log.info('Keeping %s records after compression with %s', len(reads), nut_compressor)
+
     if not environment.DRY_RUN:
-        db.write(values=reads)
+        await db.write_async(values=reads)
 
 
 @aiocron.crontab('0 */8 * * *')  # Run every 8 hours (aka 3x per day) just in case
+@profiling.profile_tick
 async def gwp_main():
     """Main GWP gather loop, designed to run forever on an interval.
 
@@ -65,10 +77,10 @@ async def gwp_main():
                  len(power_hourly) + len(weather_hourly) + len(power_daily) + len(weather_daily))
 
     if not environment.DRY_RUN:
-        db.write(values=power_hourly)
-        db.write(values=weather_hourly)
-        db.write(values=power_daily)
-        db.write(values=weather_daily)
+        await db.write_async(values=power_hourly)
+        await db.write_async(values=weather_hourly)
+        await db.write_async(values=power_daily)
+        await db.write_async(values=weather_daily)
 
 
 def seed():
@@ -76,13 +88,36 @@ def seed():
     asyncio.run(seed_opower_historical())
 
 
+def backfill(days: int = 90):
+    from homeflux.utils.backfill import backfill_opower
+    asyncio.run(backfill_opower(days))
+
+
 def run_once():
     asyncio.run(gwp_main.func())
     # asyncio.run(nut_main.func())
 
 
+async def shutdown(server: ingest.IngestServer):
+    """Stop the ingest server, writing any buffered readings, then stop the event loop.
+
+    """
+    log.info('Shutting down')
+    try:
+        await server.stop()
+    finally:
+        asyncio.get_running_loop().stop()
+
+
 def main():
-    asyncio.get_event_loop().run_forever()
+    loop = asyncio.get_event_loop()
+    profiling.install(loop)
+    if environment.INGEST_PORT or environment.INGEST_UDP_PORT:
+        server = ingest.IngestServer()
+        loop.run_until_complete(server.start())
+        for sig in [signal.SIGTERM, signal.SIGINT]:
+            loop.add_signal_handler(sig, lambda: loop.create_task(shutdown(server)))
+    loop.run_forever()
 
 
 
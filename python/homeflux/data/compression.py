@@ -0,0 +1,188 @@
+"""Module for compressing record series before they are written to the database"""
+import abc
+import math
+import datetime
+from typing import Dict, List, Optional, Tuple
+
+from homeflux import log
+from homeflux.data.data_types import AbstractRecord
+
+
+def _epoch(dt: datetime.datetime) -> float:
+    """Return the given datetime as seconds since the epoch, treating naive datetimes as UTC.
+
+    Args:
+        dt (datetime.datetime): Datetime to convert.
+
+    Returns:
+        float: Seconds since the epoch.
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.timestamp()
+
+
+class AbstractCompressor(metaclass=abc.ABCMeta):
+    """Abstract base compressor which keeps independent state for each series it sees.
+
+    A series is identified by the bucket, source and location of a record. Compressors are meant to live for the
+    lifetime of the process so that state carries over between reads.
+    """
+    tolerance: float
+    heartbeat: float
+    _state: Dict[Tuple[str, str, str], dict]
+
+    def __init__(self, tolerance: float, heartbeat: float = 900):
+        """Initialize compressor object.
+
+        Args:
+            tolerance (float): Maximum deviation allowed between the stored series and the raw series.
+            heartbeat (Optional[float]): Maximum number of seconds between stored points, default 900.
+        """
+        if tolerance < 0:
+            raise ValueError('Invalid tolerance "{}"'.format(tolerance))
+        if heartbeat <= 0:
+            raise ValueError('Invalid heartbeat "{}"'.format(heartbeat))
+        self.tolerance = tolerance
+        self.heartbeat = heartbeat
+        self._state = {}
+
+    def __repr__(self):
+        return f'[{self.__class__.__name__} tolerance={self.tolerance} heartbeat={self.heartbeat}s]'
+
+    @staticmethod
+    def series_key(record: AbstractRecord) -> Tuple[str, str, str]:
+        """Return the key used to identify the series a record belongs to.
+
+        Args:
+            record (AbstractRecord): Record to get the key for.
+
+        Returns:
+            Tuple[str, str, str]: Bucket, source and location of the record.
+        """
+        return record.bucket, getattr(record, 'source', ''), getattr(record, 'location', '')
+
+    def compress(self, values: List[AbstractRecord]) -> List[AbstractRecord]:
+        """Return only the records from `values` which need to be stored.
+
+        Args:
+            values (List[AbstractRecord]): List of records in time order.
+
+        Returns:
+            List[AbstractRecord]: List of records to write to the database.
+        """
+        result = []
+        for record in values:
+            key = self.series_key(record)
+            if key not in self._state:
+                self._state[key] = self._new_state(record)
+                result.append(record)
+                continue
+            state = self._state[key]
+            t = _epoch(record.time)
+            # Compare against the newest record seen, which may be held back rather than stored
+            if t <= state['last']:
+                log.debug('Dropping out of order record %s', repr(record))
+                continue
+            result.extend(self._add(state, record))
+            state['last'] = t
+
+        log.debug('%s kept %s of %s records', self, len(result), len(values))
+        return result
+
+    def _new_state(self, record: AbstractRecord) -> dict:
+        """Return the initial state for a series, the first record is always stored.
+
+        Args:
+            record (AbstractRecord): First record of the series.
+
+        Returns:
+            dict: State for the series.
+        """
+        t = _epoch(record.time)
+        return {'time': t, 'value': record.value, 'last': t}
+
+    @abc.abstractmethod
+    def _add(self, state: dict, record: AbstractRecord) -> List[AbstractRecord]:
+        """Add a record to the series state and return any records which need to be stored.
+
+        Args:
+            state (dict): State for the series the record belongs to.
+            record (AbstractRecord): Record to add.
+
+        Returns:
+            List[AbstractRecord]: List of records to write to the database.
+        """
+        pass
+
+
+class DeadbandCompressor(AbstractCompressor):
+    """Compressor which stores a point only when it moves more than the tolerance away from the last stored point.
+
+    """
+    def _add(self, state: dict, record: AbstractRecord) -> List[AbstractRecord]:
+        t = _epoch(record.time)
+        if abs(record.value - state['value']) > self.tolerance or t - state['time'] >= self.heartbeat:
+            state['time'] = t
+            state['value'] = record.value
+            return [record]
+        return []
+
+
+class SwingingDoorCompressor(AbstractCompressor):
+    """Compressor implementing the swinging door trending algorithm.
+
+    Points are stored so that linear interpolation between stored points stays within the tolerance of every raw
+    point. The doors are built from the points between the last stored point and the newest point, and the newest
+    point is only skipped while the line to it passes through them. The most recent raw point is held back until it
+    is known whether it is needed, so the stored series lags by at most one point or the heartbeat interval.
+    """
+    def _new_state(self, record: AbstractRecord) -> dict:
+        state = super()._new_state(record)
+        state.update({'upper': math.inf, 'lower': -math.inf, 'pending': None})
+        return state
+
+    def _add(self, state: dict, record: AbstractRecord) -> List[AbstractRecord]:
+        result = []
+        t = _epoch(record.time)
+        slope = (record.value - state['value']) / (t - state['time'])
+
+        if not state['lower'] <= slope <= state['upper']:
+            # Door closed, store the held point and restart the doors from it
+            pending = state['pending']
+            result.append(pending)
+            state.update({'time': _epoch(pending.time), 'value': pending.value, 'upper': math.inf,
+                          'lower': -math.inf})
+
+        if t - state['time'] >= self.heartbeat:
+            result.append(record)
+            state.update({'time': t, 'value': record.value, 'upper': math.inf, 'lower': -math.inf, 'pending': None})
+        else:
+            dt = t - state['time']
+            state['upper'] = min(state['upper'], (record.value + self.tolerance - state['value']) / dt)
+            state['lower'] = max(state['lower'], (record.value - self.tolerance - state['value']) / dt)
+            state['pending'] = record
+
+        return result
+
+
+COMPRESSORS = {'deadband': DeadbandCompressor,
+               'swinging_door': SwingingDoorCompressor}
+
+
+def get_compressor(name: Optional[str], tolerance: float, heartbeat: float = 900) -> Optional[AbstractCompressor]:
+    """Return a new compressor for the given algorithm name.
+
+    Args:
+        name (Optional[str]): One of `COMPRESSORS` or None/empty to disable compression.
+        tolerance (float): Maximum deviation allowed between the stored series and the raw series.
+        heartbeat (Optional[float]): Maximum number of seconds between stored points, default 900.
+
+    Returns:
+        Optional[AbstractCompressor]: Compressor instance or None if compression is disabled.
+    """
+    if not name or name.lower() == 'none':
+        return None
+    if name.lower() not in COMPRESSORS:
+        raise ValueError('Invalid compressor "{}"'.format(name))
+    return COMPRESSORS[name.lower()](tolerance, heartbeat)
@@ -1,28 +1,292 @@
 """Module for interacting with the InfluxDB database"""
-from typing import List
+import time
+import bisect
+import asyncio
+import hashlib
+import threading
+import concurrent.futures
+from typing import Dict, List, Optional
 
 from influxdb_client import InfluxDBClient
+from influxdb_client.rest import ApiException
 from influxdb_client.client.write_api import SYNCHRONOUS
 
 from homeflux.utils import timer
 from homeflux import environment, log
 from homeflux.data import data_types
 
+REPLICATE = 'replicate'
+PARTITION = 'partition'
 
-def write(values: List[data_types.AbstractRecord]) -> None:
-    """Write the list of records to the database.
+# Status codes meaning InfluxDB rejected the data itself, eg a missing bucket or a field type conflict
+PERMANENT_ERRORS = [400, 404, 422]
 
-    Args:
-        values (List[data_types.AbstractRecord]): List of records to insert into the database.
 
-    Returns:
-        None
+class Endpoint:
+    """A single InfluxDB server with its own write queue and health tracking.
+
+    Points are queued per bucket and only removed from the queue once they are written, so a node which is down or
+    restarting catches up on its next successful flush. After a failed flush the endpoint backs off exponentially and
+    is skipped until the back off has expired.
     """
-    # Open connection to database
-    t = timer.Timer()
-    client = InfluxDBClient(url=environment.INFLUX_URL, token=environment.INFLUX_TOKEN, org=environment.INFLUX_ORG)
-    log.debug('Writing %s points to %s', len(values), environment.INFLUX_URL)
-    with client.write_api(write_options=SYNCHRONOUS) as api:
+    url: str
+    max_queue: int
+    failures: int
+    retry_time: float
+    _queue: Dict[str, List[dict]]
+    _lock: threading.Lock
+    _flush_lock: threading.Lock
+    _client: Optional[InfluxDBClient] = None
+
+    def __init__(self, url: str, max_queue: int = None):
+        """Initialize endpoint object (without connecting).
+
+        Args:
+            url (str): URL of the InfluxDB server.
+            max_queue (Optional[int]): Maximum number of points to queue, default from environment.
+        """
+        self.url = url
+        self.max_queue = max_queue if max_queue is not None else environment.INFLUX_QUEUE_SIZE
+        self.failures = 0
+        self.retry_time = 0.0
+        self._queue = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def __repr__(self):
+        return f'[{self.__class__.__name__} {self.url} queued={self.queued} failures={self.failures}]'
+
+    @property
+    def healthy(self) -> bool:
+        """Return True if the endpoint is not currently backing off after a failure.
+
+        Returns:
+            bool: True if the endpoint can be written to.
+        """
+        return time.monotonic() >= self.retry_time
+
+    @property
+    def queued(self) -> int:
+        """Return the number of points waiting to be written.
+
+        Returns:
+            int: Number of queued points.
+        """
+        return sum(len(v) for v in self._queue.values())
+
+    @property
+    def client(self) -> InfluxDBClient:
+        if self._client is None:
+            self._client = InfluxDBClient(url=self.url, token=environment.INFLUX_TOKEN, org=environment.INFLUX_ORG,
+                                          timeout=environment.INFLUX_TIMEOUT)
+        return self._client
+
+    def enqueue(self, bucket: str, points: List[dict]) -> None:
+        """Add points to the queue for the given bucket, dropping the oldest points if the queue is full.
+
+        Args:
+            bucket (str): Bucket to write the points to.
+            points (List[dict]): Points in the form of `AbstractRecord.as_influx_dict()`.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._queue.setdefault(bucket, []).extend(points)
+            overflow = self.queued - self.max_queue
+            for data_list in self._queue.values():
+                if overflow <= 0:
+                    break
+                dropped = data_list[:overflow]
+                del data_list[:overflow]
+                overflow -= len(dropped)
+                log.warning('Queue for %s is full, dropped %s points', self.url, len(dropped))
+
+    def flush(self) -> int:
+        """Write all queued points to the server, unless the endpoint is backing off.
+
+        Returns:
+            int: Number of points written.
+        """
+        if not self.healthy:
+            log.debug('Skipping %s, retrying in %.1f seconds', self, self.retry_time - time.monotonic())
+            return 0
+        if not self._flush_lock.acquire(blocking=False):
+            log.debug('Skipping %s, already flushing', self)
+            return 0
+        try:
+            return self._flush()
+        finally:
+            self._flush_lock.release()
+
+    def _flush(self) -> int:
+        with self._lock:
+            queue, self._queue = self._queue, {}
+
+        written = 0
+        failed = False
+        with self.client.write_api(write_options=SYNCHRONOUS) as api:
+            for bucket in list(queue):
+                log.info('Writing %s points to bucket: %s on %s', len(queue[bucket]), bucket, self.url)
+                try:
+                    written += self._write_bucket(api, bucket, queue[bucket])
+                except Exception:
+                    failed = True
+                    log.exception('Failed to write bucket %s to %s', bucket, self.url)
+                else:
+                    queue.pop(bucket)
+
+        if failed:
+            self.failures += 1
+            delay = min(2 ** (self.failures - 1), environment.INFLUX_RETRY_MAX)
+            self.retry_time = time.monotonic() + delay
+            log.warning('Failed to write to %s, retrying in %s seconds', self.url, delay)
+            # Put the unwritten points back in front of anything queued while writing
+            with self._lock:
+                for bucket, data_list in self._queue.items():
+                    queue.setdefault(bucket, []).extend(data_list)
+                self._queue = queue
+        else:
+            self.failures = 0
+            self.retry_time = 0.0
+
+        return written
+
+
+    def _write_bucket(self, api, bucket: str, points: List[dict]) -> int:
+        """Write points to a bucket. A batch InfluxDB rejects is split in half and retried, so only the bad points
+        are dropped. Other errors are raised so the points stay queued.
+
+        Args:
+            api (WriteApi): Write API to write with.
+            bucket (str): Bucket to write the points to.
+            points (List[dict]): Points in the form of `AbstractRecord.as_influx_dict()`.
+
+        Returns:
+            int: Number of points written.
+        """
+        try:
+            api.write(bucket, environment.INFLUX_ORG, points)
+            return len(points)
+        except ApiException as e:
+            if e.status not in PERMANENT_ERRORS:
+                raise
+            # A missing bucket rejects every point, splitting won't help
+            if e.status == 404 or len(points) == 1:
+                log.error('%s rejected %s points for bucket %s, dropping them: %s %s', self.url, len(points),
+                          bucket, e.status, e.body or e.reason)
+                return 0
+
+        half = len(points) // 2
+        return self._write_bucket(api, bucket, points[:half]) + self._write_bucket(api, bucket, points[half:])
+
+class HashRing:
+    """Consistent hash ring used to assign keys to endpoints.
+
+    """
+    replicas: int
+    _keys: List[int]
+    _nodes: Dict[int, str]
+
+    def __init__(self, nodes: List[str], replicas: int = 64):
+        """Initialize hash ring object.
+
+        Args:
+            nodes (List[str]): Names of the nodes on the ring.
+            replicas (Optional[int]): Number of virtual nodes per node, default 64.
+        """
+        if not nodes:
+            raise ValueError('Cannot create a hash ring without nodes')
+        self.replicas = replicas
+        self._nodes = {}
+        for node in nodes:
+            for i in range(replicas):
+                self._nodes[self._hash(f'{node}#{i}')] = node
+        self._keys = sorted(self._nodes)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+    def get(self, key: str) -> str:
+        """Return the node which owns the given key.
+
+        Args:
+            key (str): Key to look up.
+
+        Returns:
+            str: Name of the node.
+        """
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._nodes[self._keys[index]]
+
+
+class Writer:
+    """Writes records to one or more InfluxDB endpoints.
+
+    In `REPLICATE` mode every point is queued on every endpoint. In `PARTITION` mode each series (or bucket) is
+    assigned to a single endpoint with a `HashRing`. Endpoints are flushed in parallel, each in its own thread, and a
+    flush still running from a previous write is left alone so a slow endpoint never holds up the others.
+    """
+    mode: str
+    partition_by: str
+    endpoints: Dict[str, Endpoint]
+    ring: Optional[HashRing] = None
+    _executor: concurrent.futures.ThreadPoolExecutor
+    _futures: Dict[str, concurrent.futures.Future]
+    _lock: threading.Lock
+
+    def __init__(self, urls: List[str], mode: str = REPLICATE, partition_by: str = 'series'):
+        """Initialize writer object.
+
+        Args:
+            urls (List[str]): URLs of the InfluxDB servers.
+            mode (Optional[str]): `REPLICATE` or `PARTITION`, default `REPLICATE`.
+            partition_by (Optional[str]): In `PARTITION` mode, hash by "series" or "bucket", default "series".
+        """
+        if not urls:
+            raise ValueError('No InfluxDB URLs configured')
+        if mode not in [REPLICATE, PARTITION]:
+            raise ValueError('Invalid write mode "{}"'.format(mode))
+        if partition_by not in ['series', 'bucket']:
+            raise ValueError('Invalid partition key "{}"'.format(partition_by))
+        self.mode = mode
+        self.partition_by = partition_by
+        self.endpoints = {url: Endpoint(url) for url in urls}
+        if mode == PARTITION:
+            self.ring = HashRing(list(self.endpoints))
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(self.endpoints),
+                                                               thread_name_prefix='homeflux-writer')
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'[{self.__class__.__name__} {self.mode} {list(self.endpoints)}]'
+
+    def partition_key(self, bucket: str, point: dict) -> str:
+        """Return the key used to assign a point to an endpoint in `PARTITION` mode.
+
+        Args:
+            bucket (str): Bucket the point is written to.
+            point (dict): Point in the form of `AbstractRecord.as_influx_dict()`.
+
+        Returns:
+            str: Partition key.
+        """
+        if self.partition_by == 'bucket':
+            return bucket
+        tags = ','.join(f'{k}={v}' for k, v in sorted(point['tags'].items()))
+        return f'{bucket}/{point["measurement"]}/{tags}'
+
+    def enqueue(self, values: List[data_types.AbstractRecord]) -> None:
+        """Queue the records on the endpoints they belong to.
+
+        Args:
+            values (List[data_types.AbstractRecord]): List of records to queue.
+
+        Returns:
+            None
+        """
         # Group items by bucket
         out_dict = {}
         for obj in values:
@@ -30,10 +294,100 @@ def write(values: List[data_types.AbstractRecord]) -> None:
                 out_dict[obj.bucket] = []
             out_dict[obj.bucket].append(obj.as_influx_dict())
 
-        # Insert data into database
         for bucket, data_list in out_dict.items():
-            log.info('Writing %s points to bucket: %s', len(data_list), bucket)
-            for data_to_write in data_list:
-                api.write(bucket, environment.INFLUX_ORG, data_to_write)
+            if self.mode == REPLICATE:
+                for endpoint in self.endpoints.values():
+                    endpoint.enqueue(bucket, data_list)
+                continue
+            partitions = {}
+            for point in data_list:
+                url = self.ring.get(self.partition_key(bucket, point))
+                partitions.setdefault(url, []).append(point)
+            for url, points in partitions.items():
+                self.endpoints[url].enqueue(bucket, points)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Start a flush on every endpoint which is not already flushing and wait up to `timeout` for them.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait for the flushes, None waits until they are done.
 
-    log.info('Took %s seconds to write %s points %s', t.end(), len(values), environment.INFLUX_URL)
+        Returns:
+            None
+        """
+        futures = []
+        # write() can be called from several executor threads at once
+        with self._lock:
+            for url, endpoint in self.endpoints.items():
+                future = self._futures.get(url)
+                if future is not None and not future.done():
+                    log.warning('%s is still flushing, leaving %s points queued', url, endpoint.queued)
+                    continue
+                self._futures[url] = self._executor.submit(endpoint.flush)
+                futures.append(self._futures[url])
+
+        done, not_done = concurrent.futures.wait(futures, timeout=timeout)
+        if not_done:
+            log.warning('%s writes still running after %s seconds, continuing in the background', len(not_done),
+                        timeout)
+
+    def write(self, values: List[data_types.AbstractRecord], timeout: Optional[float] = None) -> None:
+        """Queue the records and flush all endpoints.
+
+        Args:
+            values (List[data_types.AbstractRecord]): List of records to insert into the database.
+            timeout (Optional[float]): Seconds to wait for the flushes, None waits until they are done.
+
+        Returns:
+            None
+        """
+        self.enqueue(values)
+        self.flush(timeout=timeout)
+
+
+_writer: Optional[Writer] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> Writer:
+    """Return the shared writer for the endpoints configured in the environment.
+
+    Returns:
+        Writer: Shared writer instance.
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = Writer(environment.INFLUX_URLS, environment.INFLUX_WRITE_MODE,
+                                 environment.INFLUX_PARTITION_BY)
+    return _writer
+
+
+def write(values: List[data_types.AbstractRecord]) -> None:
+    """Write the list of records to the database.
+
+    Args:
+        values (List[data_types.AbstractRecord]): List of records to insert into the database.
+
+    Returns:
+        None
+    """
+    t = timer.Timer()
+    writer = get_writer()
+    log.debug('Writing %s points with %s', len(values), writer)
+    writer.write(values, timeout=environment.INFLUX_TIMEOUT / 1000)
+    log.info('Took %s seconds to write %s points with %s', t.end(), len(values), writer)
+
+
+async def write_async(values: List[data_types.AbstractRecord]) -> None:
+    """Write the list of records to the database from an executor thread, so the event loop is never blocked
+    waiting on a slow endpoint.
+
+    Args:
+        values (List[data_types.AbstractRecord]): List of records to insert into the database.
+
+    Returns:
+        None
+    """
+    await asyncio.get_running_loop().run_in_executor(None, write, values)
@@ -6,10 +6,17 @@ DEBUG = bool(os.getenv('HOMEFLUX_DEBUG', False))
 DRY_RUN = bool(os.getenv('HOMEFLUX_DRY_RUN', False))
 DOCKER = bool(os.getenv('HOMEFLUX_DOCKER', False))
 TEST = bool(os.getenv('UNIT_TEST', False))
+TIMEZONE = os.getenv('HOMEFLUX_TIMEZONE')
 
 INFLUX_TOKEN = os.getenv("INFLUX_TOKEN")
 INFLUX_URL = os.getenv("INFLUX_URL")
 INFLUX_ORG = os.getenv("INFLUX_ORG")
+INFLUX_URLS = ast.literal_eval(os.getenv("INFLUX_URLS", "[]")) or ([INFLUX_URL] if INFLUX_URL else [])
+INFLUX_WRITE_MODE = os.getenv("INFLUX_WRITE_MODE", "replicate")
+INFLUX_PARTITION_BY = os.getenv("INFLUX_PARTITION_BY", "series")
+INFLUX_TIMEOUT = ast.literal_eval(os.getenv("INFLUX_TIMEOUT", "10000"))
+INFLUX_QUEUE_SIZE = ast.literal_eval(os.getenv("INFLUX_QUEUE_SIZE", "100000"))
+INFLUX_RETRY_MAX = ast.literal_eval(os.getenv("INFLUX_RETRY_MAX", "300"))
 
 GWP_USER = os.getenv("GWP_USER")
 GWP_PASSWORD = os.getenv("GWP_PASSWORD")
@@ -20,3 +27,19 @@ NUT_PASSWORD = os.getenv("NUT_PASSWORD")
 NUT_PORT = ast.literal_eval(os.getenv("NUT_PORT", "3493"))
 NUT_UPS_NAME = os.getenv("NUT_UPS_NAME", "ups")
 NUT_HOSTS = ast.literal_eval(os.getenv("NUT_HOSTS", "{}"))
+NUT_COMPRESSION = os.getenv("NUT_COMPRESSION")
+NUT_COMPRESSION_TOLERANCE = float(os.getenv("NUT_COMPRESSION_TOLERANCE", "1.0"))
+NUT_COMPRESSION_HEARTBEAT = ast.literal_eval(os.getenv("NUT_COMPRESSION_HEARTBEAT", "900"))
+
+PROFILE_DIR = os.getenv("HOMEFLUX_PROFILE_DIR", "profile")
+PROFILE_AGENTS = [a for a in os.getenv("HOMEFLUX_PROFILE_AGENTS", "").split(',') if a]
+PROFILE_SLOW_CALLBACK_MS = ast.literal_eval(os.getenv("HOMEFLUX_PROFILE_SLOW_CALLBACK_MS", "0"))
+PROFILE_TRACEMALLOC_INTERVAL = ast.literal_eval(os.getenv("HOMEFLUX_PROFILE_TRACEMALLOC_INTERVAL", "0"))
+PROFILE_TRACEMALLOC_FRAMES = ast.literal_eval(os.getenv("HOMEFLUX_PROFILE_TRACEMALLOC_FRAMES", "1"))
+
+INGEST_HOST = os.getenv("INGEST_HOST", "0.0.0.0")
+INGEST_PORT = ast.literal_eval(os.getenv("INGEST_PORT", "0"))
+INGEST_UDP_PORT = ast.literal_eval(os.getenv("INGEST_UDP_PORT", "0"))
+INGEST_BATCH_SIZE = ast.literal_eval(os.getenv("INGEST_BATCH_SIZE", "5000"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "5"))
+INGEST_MAX_BODY = ast.literal_eval(os.getenv("INGEST_MAX_BODY", "1048576"))
@@ -0,0 +1,227 @@
+"""Module for finding and filling gaps in the GWP OPower data already in InfluxDB"""
+import datetime
+from typing import Dict, List, Tuple
+
+from influxdb_client import InfluxDBClient
+
+from homeflux import log, environment
+from homeflux.data import database as db
+from homeflux.agents import gwp_opower
+from homeflux.utils import time_utils
+
+# OPower only returns 30 days per request
+MAX_REQUEST_DAYS = 30
+
+# Each GWP series, where it is stored and whether it has a point per hour or per day. Power reads are stamped with
+# the end of the hour or day, so they are counted towards the local day they end in. The hourly weather URL runs from
+# midnight to midnight, so it needs the day after the last day to include that day.
+GWP_SERIES = [
+    {'name': 'power_hourly', 'bucket': 'home-hour', 'measurement': 'power', 'hourly': True, 'end_stamped': True,
+     'end_exclusive': False, 'method': 'get_power_hourly'},
+    {'name': 'weather_hourly', 'bucket': 'home-hour', 'measurement': 'temperature', 'hourly': True,
+     'end_stamped': False, 'end_exclusive': True, 'method': 'get_weather_hourly'},
+    {'name': 'power_daily', 'bucket': 'home-day', 'measurement': 'power', 'hourly': False, 'end_stamped': True,
+     'end_exclusive': False, 'method': 'get_power_daily'},
+    {'name': 'weather_daily', 'bucket': 'home-day', 'measurement': 'temperature', 'hourly': False,
+     'end_stamped': False, 'end_exclusive': False, 'method': 'get_weather_daily'},
+]
+
+# The range is padded by a day either side since local days don't line up with UTC days
+_TIMES_QUERY = '''from(bucket: "{bucket}")
+  |> range(start: {start}T00:00:00Z, stop: {stop}T00:00:00Z)
+  |> filter(fn: (r) => r._measurement == "{measurement}" and r.source == "homeflux.gwp_opower")
+  |> keep(columns: ["_time"])'''
+
+
+def query_daily_counts(series: dict, start_date: datetime.date, end_date: datetime.date) -> Dict[datetime.date, int]:
+    """Return the number of points stored per local day, in `time_utils.timezone()`, for a GWP series.
+
+    With several InfluxDB endpoints the counts are combined to match the write mode: the lowest count wins when
+    replicating, so a day missing on any endpoint is refetched, and counts are summed when partitioning. Endpoints
+    which can't be queried are skipped.
+
+    Args:
+        series (dict): Series from `GWP_SERIES`.
+        start_date (datetime.date): First day to count.
+        end_date (datetime.date): Last day to count.
+
+    Returns:
+        Dict[datetime.date, int]: Number of points for each day that has any.
+    """
+    query = _TIMES_QUERY.format(bucket=series['bucket'], measurement=series['measurement'],
+                                start=start_date - datetime.timedelta(days=1),
+                                stop=end_date + datetime.timedelta(days=2))
+    result = None
+    for url in environment.INFLUX_URLS:
+        client = InfluxDBClient(url=url, token=environment.INFLUX_TOKEN, org=environment.INFLUX_ORG)
+        try:
+            times = [record.get_time() for table in client.query_api().query(query, org=environment.INFLUX_ORG)
+                     for record in table.records]
+        except Exception:
+            log.exception('Failed to query %s for %s coverage, skipping it', url, series['name'])
+            continue
+        finally:
+            client.close()
+        counts = count_local_days(times, series['end_stamped'])
+
+        if result is None:
+            result = counts
+        elif environment.INFLUX_WRITE_MODE == db.PARTITION:
+            for day, count in counts.items():
+                result[day] = result.get(day, 0) + count
+        else:
+            result = {day: min(count, counts.get(day, 0)) for day, count in result.items()}
+
+    if result is None:
+        raise RuntimeError('Could not query {} coverage from any InfluxDB endpoint'.format(series['name']))
+    return result
+
+
+def count_local_days(times: List[datetime.datetime], end_stamped: bool = False) -> Dict[datetime.date, int]:
+    """Return the number of points per local day, in `time_utils.timezone()`.
+
+    Args:
+        times (List[datetime.datetime]): Aware point times.
+        end_stamped (Optional[bool]): If True, points are stamped with the end of their period and a point at local
+            midnight counts towards the day before.
+
+    Returns:
+        Dict[datetime.date, int]: Number of points for each day that has any.
+    """
+    tz = time_utils.timezone()
+    shift = datetime.timedelta(seconds=1 if end_stamped else 0)
+    counts = {}
+    for t in times:
+        day = (t - shift).astimezone(tz).date()
+        counts[day] = counts.get(day, 0) + 1
+    return counts
+
+
+def request_deltas(series: dict, start: datetime.date, end: datetime.date,
+                   today: datetime.date) -> Tuple[int, int]:
+    """Return the start and end date deltas from today to pass to the `Meter` method to fetch an inclusive range.
+
+    Args:
+        series (dict): Series from `GWP_SERIES`.
+        start (datetime.date): First day to fetch.
+        end (datetime.date): Last day to fetch.
+        today (datetime.date): Date the deltas are relative to.
+
+    Returns:
+        Tuple[int, int]: Start and end date deltas.
+    """
+    if series['end_exclusive']:
+        end += datetime.timedelta(days=1)
+    return (start - today).days, (end - today).days
+
+
+def expected_points(date: datetime.date, hourly: bool) -> int:
+    """Return the number of points making up a complete local day, 23 or 25 hours on days DST starts or ends.
+
+    Args:
+        date (datetime.date): Local date.
+        hourly (bool): True for a series with a point per hour, False for a point per day.
+
+    Returns:
+        int: Number of points.
+    """
+    if not hourly:
+        return 1
+    next_date = date + datetime.timedelta(days=1)
+    return 24 + (time_utils.utc_offset(date) - time_utils.utc_offset(next_date)) // 3600
+
+
+def coverage(counts: Dict[datetime.date, int], start_date: datetime.date, end_date: datetime.date,
+             hourly: bool) -> List[bool]:
+    """Return a bitmap of which days between `start_date` and `end_date` have all of their points.
+
+    Args:
+        counts (Dict[datetime.date, int]): Number of points for each day.
+        start_date (datetime.date): First day of the bitmap.
+        end_date (datetime.date): Last day of the bitmap.
+        hourly (bool): True for a series with a point per hour, False for a point per day.
+
+    Returns:
+        List[bool]: One entry per day, True if the day is complete.
+    """
+    days = [start_date + datetime.timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    return [counts.get(day, 0) >= expected_points(day, hourly) for day in days]
+
+
+def coalesce(bitmap: List[bool], start_date: datetime.date,
+             max_days: int = MAX_REQUEST_DAYS) -> List[Tuple[datetime.date, datetime.date]]:
+    """Return the fewest date ranges, each spanning at most `max_days`, which cover every missing day in the bitmap.
+
+    Complete days between two gaps are refetched when that saves a request, rewriting them is harmless since InfluxDB
+    overwrites points with the same series and time.
+
+    Args:
+        bitmap (List[bool]): Coverage bitmap from `coverage`.
+        start_date (datetime.date): Date of the first entry in the bitmap.
+        max_days (Optional[int]): Maximum span of a range in days, default `MAX_REQUEST_DAYS`.
+
+    Returns:
+        List[Tuple[datetime.date, datetime.date]]: List of (start, end) date ranges, inclusive.
+    """
+    ranges = []
+    range_start = range_end = None
+    for i, complete in enumerate(bitmap):
+        if complete:
+            continue
+        if range_start is not None and i - range_start < max_days:
+            range_end = i
+            continue
+        if range_start is not None:
+            ranges.append((range_start, range_end))
+        range_start = range_end = i
+    if range_start is not None:
+        ranges.append((range_start, range_end))
+
+    return [(start_date + datetime.timedelta(days=s), start_date + datetime.timedelta(days=e)) for s, e in ranges]
+
+
+def plan(start_date: datetime.date, end_date: datetime.date) -> Dict[str, List[Tuple[datetime.date, datetime.date]]]:
+    """Return the date ranges to fetch for each GWP series to fill every gap between `start_date` and `end_date`.
+
+    Args:
+        start_date (datetime.date): First day to check.
+        end_date (datetime.date): Last day to check.
+
+    Returns:
+        Dict[str, List[Tuple[datetime.date, datetime.date]]]: Date ranges to fetch keyed by series name.
+    """
+    result = {}
+    for series in GWP_SERIES:
+        counts = query_daily_counts(series, start_date, end_date)
+        bitmap = coverage(counts, start_date, end_date, series['hourly'])
+        result[series['name']] = coalesce(bitmap, start_date)
+        log.info('%s is missing %s of %s days, %s requests needed', series['name'], bitmap.count(False),
+                 len(bitmap), len(result[series['name']]))
+
+    return result
+
+
+async def backfill_opower(days: int = 90):
+    """Fill any gaps in the GWP OPower data from the last `days` days.
+
+    Args:
+        days (Optional[int]): Number of days to check, default 90.
+
+    Returns:
+        None
+    """
+    today = datetime.date.today()
+    ranges = plan(today - datetime.timedelta(days=days), today - datetime.timedelta(days=1))
+    if not any(ranges.values()):
+        log.info('No gaps found in the last %s days', days)
+        return
+
+    meter = gwp_opower.Meter(environment.GWP_USER, environment.GWP_PASSWORD, environment.GWP_UUID)
+    async with meter:
+        for series in GWP_SERIES:
+            method = getattr(meter, series['method'])
+            for start, end in ranges[series['name']]:
+                log.info('Backfilling %s %s => %s', series['name'], start, end)
+                values = await method(*request_deltas(series, start, end, today))
+                if not environment.DRY_RUN:
+                    await db.write_async(values=values)
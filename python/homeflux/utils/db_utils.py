@@ -9,7 +9,7 @@ from homeflux.agents import gwp_opower
 
 
 def generate_buckets(delete_existing: bool = False):
-    """Generate the default buckets on the InfluxDB server.
+    """Generate the default buckets on every InfluxDB server.
 
     Args:
         delete_existing (bool): If True, will delete the buckets if they already exist.
@@ -21,20 +21,21 @@ def generate_buckets(delete_existing: bool = False):
     _times = ['minute', 'hour', 'day', 'week']
     buckets = [f'{b}-{t}' for b in _buckets for t in _times]
 
-    client = InfluxDBClient(url=environment.INFLUX_URL, token=environment.INFLUX_TOKEN, org=environment.INFLUX_ORG)
-    api = client.buckets_api()
-    for bucket in buckets:
-        search = api.find_bucket_by_name(bucket)
-        if search:
-            if delete_existing:
-                log.info('Deleting bucket %s on %s', bucket, environment.INFLUX_URL)
-                api.delete_bucket(search)
-            else:
-                log.info('Bucket %s on %s already exists', bucket, environment.INFLUX_URL)
-                continue
+    for url in environment.INFLUX_URLS:
+        client = InfluxDBClient(url=url, token=environment.INFLUX_TOKEN, org=environment.INFLUX_ORG)
+        api = client.buckets_api()
+        for bucket in buckets:
+            search = api.find_bucket_by_name(bucket)
+            if search:
+                if delete_existing:
+                    log.info('Deleting bucket %s on %s', bucket, url)
+                    api.delete_bucket(search)
+                else:
+                    log.info('Bucket %s on %s already exists', bucket, url)
+                    continue
 
-        log.info('Creating bucket %s on %s', bucket, environment.INFLUX_URL)
-        api.create_bucket(bucket_name=bucket, org=environment.INFLUX_ORG)
+            log.info('Creating bucket %s on %s', bucket, url)
+            api.create_bucket(bucket_name=bucket, org=environment.INFLUX_ORG)
 
 
 async def seed_opower_historical():
@@ -60,9 +61,9 @@ async def seed_opower_historical():
             weather_hourly = await meter.get_weather_hourly(start, end)
             power_daily = await meter.get_power_daily(start, end)
             weather_daily = await meter.get_weather_daily(start, end)
-            db.write(values=power_hourly)
-            db.write(values=weather_hourly)
-            db.write(values=power_daily)
-            db.write(values=weather_daily)
+            await db.write_async(values=power_hourly)
+            await db.write_async(values=weather_hourly)
+            await db.write_async(values=power_daily)
+            await db.write_async(values=weather_daily)
             start -= 30
             end -= 30
@@ -0,0 +1,160 @@
+"""Module for on demand profiling of the long running daemon"""
+import os
+import signal
+import asyncio
+import cProfile
+import datetime
+import functools
+import logging
+import tracemalloc
+from typing import Optional
+
+from homeflux import environment, log
+
+_profile_all = False
+_profile_active = False
+_snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+def _output_path(name: str) -> str:
+    """Return a timestamped path for the given file name in the profiling directory, creating it if needed.
+
+    Args:
+        name (str): File name, "{timestamp}" is replaced with the current UTC time.
+
+    Returns:
+        str: Full path to the file.
+    """
+    os.makedirs(environment.PROFILE_DIR, exist_ok=True)
+    timestamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+    return os.path.join(environment.PROFILE_DIR, name.format(timestamp=timestamp))
+
+
+def profile_tick(func):
+    """Decorator to capture a cProfile of each run of an agent coroutine.
+
+    The coroutine is profiled if its name is in `environment.PROFILE_AGENTS` or profiling of all agents has been
+    toggled on with SIGUSR2. Other tasks running on the loop while it awaits are included in the profile. Only one
+    profile can be active at a time, a tick starting while another is being profiled runs without a profile.
+
+    Args:
+        func: Coroutine function to profile.
+
+    Returns:
+        Wrapped coroutine function.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        global _profile_active
+        if not _profile_all and func.__name__ not in environment.PROFILE_AGENTS:
+            return await func(*args, **kwargs)
+        if _profile_active:
+            log.info('Another tick is already being profiled, running %s without a profile', func.__name__)
+            return await func(*args, **kwargs)
+
+        _profile_active = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            _profile_active = False
+            path = _output_path(f'{func.__name__}-{{timestamp}}.prof')
+            profiler.dump_stats(path)
+            log.info('Wrote profile for %s to %s', func.__name__, path)
+
+    return wrapper
+
+
+def snapshot_memory(limit: int = 25) -> Optional[str]:
+    """Take a tracemalloc snapshot and write the top allocations, and the top differences from the previous snapshot,
+    to the profiling directory.
+
+    Args:
+        limit (Optional[int]): Number of allocations to write, default 25.
+
+    Returns:
+        Optional[str]: Path to the written file, None if tracemalloc is not running.
+    """
+    global _snapshot
+    if not tracemalloc.is_tracing():
+        log.warning('tracemalloc is not running, cannot take a snapshot')
+        return None
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ])
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f'Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB', '',
+             f'Top {limit} allocations:']
+    lines.extend(str(s) for s in snapshot.statistics('lineno')[:limit])
+    if _snapshot is not None:
+        lines.extend(['', f'Top {limit} differences from previous snapshot:'])
+        lines.extend(str(s) for s in snapshot.compare_to(_snapshot, 'lineno')[:limit])
+    _snapshot = snapshot
+
+    path = _output_path('tracemalloc-{timestamp}.txt')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    log.info('Wrote tracemalloc snapshot to %s', path)
+    return path
+
+
+async def _snapshot_memory_loop(interval: float):
+    """Take a tracemalloc snapshot every `interval` seconds, forever.
+
+    Args:
+        interval (float): Seconds between snapshots.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        snapshot_memory()
+
+
+def _toggle_profile_all():
+    global _profile_all
+    _profile_all = not _profile_all
+    log.info('Profiling of all agents %s', 'enabled' if _profile_all else 'disabled')
+
+
+def _on_snapshot_signal():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(environment.PROFILE_TRACEMALLOC_FRAMES)
+        log.info('Started tracemalloc')
+    snapshot_memory()
+
+
+def install(loop: asyncio.AbstractEventLoop) -> None:
+    """Install the profiling hooks configured in the environment on the given loop.
+
+    - `HOMEFLUX_PROFILE_SLOW_CALLBACK_MS` turns on asyncio debug mode and logs callbacks blocking the loop for longer.
+    - `HOMEFLUX_PROFILE_TRACEMALLOC_INTERVAL` takes a tracemalloc snapshot every N seconds.
+    - SIGUSR1 takes a tracemalloc snapshot now, starting tracemalloc if needed.
+    - SIGUSR2 toggles profiling of every agent tick.
+
+    Args:
+        loop (asyncio.AbstractEventLoop): Event loop the daemon runs on.
+
+    Returns:
+        None
+    """
+    if environment.PROFILE_SLOW_CALLBACK_MS:
+        loop.set_debug(True)
+        loop.slow_callback_duration = environment.PROFILE_SLOW_CALLBACK_MS / 1000
+        handler = logging.FileHandler(_output_path('slow_callbacks.log'))
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logging.getLogger('asyncio').addHandler(handler)
+        log.info('Logging callbacks slower than %sms', environment.PROFILE_SLOW_CALLBACK_MS)
+
+    if environment.PROFILE_TRACEMALLOC_INTERVAL:
+        tracemalloc.start(environment.PROFILE_TRACEMALLOC_FRAMES)
+        loop.create_task(_snapshot_memory_loop(environment.PROFILE_TRACEMALLOC_INTERVAL))
+        log.info('Taking tracemalloc snapshots every %s seconds', environment.PROFILE_TRACEMALLOC_INTERVAL)
+
+    try:
+        loop.add_signal_handler(signal.SIGUSR1, _on_snapshot_signal)
+        loop.add_signal_handler(signal.SIGUSR2, _toggle_profile_all)
+    except (AttributeError, NotImplementedError):
+        log.debug('Profiling signals are not supported on this platform')
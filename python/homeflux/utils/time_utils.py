@@ -0,0 +1,125 @@
+"""Module for DST aware time zone handling and fast timestamp normalization"""
+import re
+import datetime
+import functools
+from typing import List
+
+import tzlocal
+from zoneinfo import ZoneInfo
+
+from homeflux import environment
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_ISO = re.compile(r'(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2}))?(?:\.\d+)?)?\s*(Z|[+-]\d{2}:?\d{2})?$')
+
+
+@functools.lru_cache(maxsize=1)
+def timezone() -> datetime.tzinfo:
+    """Return the time zone the meter readings are in, `environment.TIMEZONE` or the system time zone.
+
+    Returns:
+        datetime.tzinfo: Time zone.
+    """
+    if environment.TIMEZONE:
+        return ZoneInfo(environment.TIMEZONE)
+    return tzlocal.get_localzone()
+
+
+@functools.lru_cache(maxsize=4096)
+def _local_offset(year: int, month: int, day: int, hour: int) -> int:
+    dt = datetime.datetime(year, month, day, hour, tzinfo=timezone())
+    return int(dt.utcoffset().total_seconds())
+
+
+def utc_offset(date: datetime.date, hour: int = 0) -> int:
+    """Return the UTC offset in seconds of the local time zone at the given local date and hour.
+
+    Args:
+        date (datetime.date): Local date.
+        hour (Optional[int]): Local hour, default 0 (midnight).
+
+    Returns:
+        int: UTC offset in seconds, negative west of UTC.
+    """
+    return _local_offset(date.year, date.month, date.day, hour)
+
+
+def format_offset(date: datetime.date, hour: int = 0) -> str:
+    """Return the UTC offset of the local time zone at the given local date and hour as "+HH:MM".
+
+    Args:
+        date (datetime.date): Local date.
+        hour (Optional[int]): Local hour, default 0 (midnight).
+
+    Returns:
+        str: UTC offset, eg "-07:00".
+    """
+    offset = utc_offset(date, hour)
+    sign = '-' if offset < 0 else '+'
+    hours, minutes = divmod(abs(offset) // 60, 60)
+    return f'{sign}{hours:02d}:{minutes:02d}'
+
+
+def url_time(date: datetime.date) -> str:
+    """Return the URL encoded local midnight time suffix for a date, eg "T00%3A00%3A00-07%3A00".
+
+    Args:
+        date (datetime.date): Local date.
+
+    Returns:
+        str: Time suffix to append to the date in a URL.
+    """
+    return f'T00:00:00{format_offset(date)}'.replace(':', '%3A')
+
+
+@functools.lru_cache(maxsize=64)
+def _parse_offset(offset: str) -> int:
+    if offset == 'Z':
+        return 0
+    offset = offset.replace(':', '')
+    seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+    return -seconds if offset[0] == '-' else seconds
+
+
+@functools.lru_cache(maxsize=4096)
+def _day_seconds(year: int, month: int, day: int) -> int:
+    return (datetime.date(year, month, day).toordinal() - _EPOCH_ORDINAL) * 86400
+
+
+def to_epoch(timestamps: List[str], local_date: bool = False) -> List[int]:
+    """Return a list of ISO 8601 timestamps as UTC epoch seconds.
+
+    Timestamps with an offset (or "Z") are converted as is. Timestamps without an offset are local times and use the
+    offset of the local time zone at that date and hour, so readings either side of a DST change are both correct.
+    The date and offset conversions are cached, so a whole array of reads only pays for one regex match each.
+
+    Args:
+        timestamps (List[str]): List of ISO 8601 timestamps, eg "2021-04-20T01:00:00.000-07:00".
+        local_date (Optional[bool]): If True, only the date is used and converted to local midnight. This is for reads
+            like the daily weather which mark a local date as midnight UTC.
+
+    Returns:
+        List[int]: List of epoch seconds.
+    """
+    result = []
+    for ts in timestamps:
+        match = _ISO.match(ts)
+        if match is None:
+            raise ValueError(f'Invalid timestamp "{ts}"')
+        year, month, day, hour, minute, second, offset = match.groups()
+        year, month, day = int(year), int(month), int(day)
+        date_seconds = _day_seconds(year, month, day)
+        if local_date:
+            result.append(date_seconds - _local_offset(year, month, day, 0))
+            continue
+
+        hour = int(hour or 0)
+        seconds = date_seconds + hour * 3600 + int(minute or 0) * 60 + int(second or 0)
+        if offset is None:
+            seconds -= _local_offset(year, month, day, hour)
+        else:
+            seconds -= _parse_offset(offset)
+        result.append(seconds)
+
+    return result
+